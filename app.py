@@ -19,13 +19,31 @@ app = Flask(__name__)
 app.secret_key = os.environ.get("SESSION_SECRET", "fallback_secret_key_for_development")
 app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
 
-# Configure the SQLite database
+# Configure the database (SQLite by default, PostgreSQL in production)
 database_url = os.environ.get("DATABASE_URL", "sqlite:///frantoio.db")
+for scheme in ("postgres://", "postgresql://"):
+    # Use the psycopg2 driver listed in the dependencies
+    if database_url.startswith(scheme):
+        database_url = "postgresql+psycopg2://" + database_url[len(scheme):]
 app.config["SQLALCHEMY_DATABASE_URI"] = database_url
 app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
     "pool_recycle": 300,
     "pool_pre_ping": True,
 }
+if database_url.startswith("postgresql"):
+    # The pool belongs to each gunicorn worker: PostgreSQL sees up to
+    # workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW) connections
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"].update({
+        "pool_size": int(os.environ.get("DB_POOL_SIZE", 5)),
+        "max_overflow": int(os.environ.get("DB_MAX_OVERFLOW", 10)),
+        "pool_timeout": int(os.environ.get("DB_POOL_TIMEOUT", 30)),
+        "connect_args": {
+            # Milliseconds; stops runaway queries from holding a worker
+            "options": f"-c statement_timeout={int(os.environ.get('DB_STATEMENT_TIMEOUT', 30000))}",
+        },
+    })
+# Rows fetched per batch by large reads (a server-side cursor on PostgreSQL)
+app.config["DB_YIELD_PER"] = int(os.environ.get("DB_YIELD_PER", 500))
 
 # Initialize the app with the extension
 db.init_app(app)
@@ -44,6 +62,11 @@ with app.app_context():
     # Create all tables
     db.create_all()
     
+    # Add duplicate-detection columns to databases created before they existed
+    # (existing rows are filled in by `flask indicizza-clienti`)
+    from deduplica import aggiorna_schema_clienti
+    aggiorna_schema_clienti()
+    
     # Create default admin user if not exists
     from models import User
     admin_user = User.query.filter_by(username='admin').first()
@@ -58,6 +81,9 @@ with app.app_context():
         db.session.add(limited_user)
         
         db.session.commit()
+    
+    # Don't hand startup connections over to forked gunicorn workers
+    db.engine.dispose()
 
 @login_manager.user_loader
 def load_user(user_id):
@@ -66,6 +92,9 @@ def load_user(user_id):
 
 # Import routes after app context setup to avoid circular imports
 import routes
+import assets
+import compressione
+import frammenti
 
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000, debug=True)
@@ -0,0 +1,83 @@
+import os
+import re
+import json
+import mimetypes
+from flask import url_for, send_from_directory, request, abort
+from app import app
+from build_assets import STATIC_DIR, DIST_DIR, MANIFEST_PATH, VENDOR, BUNDLES
+
+# Un anno: i file in dist hanno l'hash del contenuto nel nome, quindi non cambiano mai
+ASSET_MAX_AGE = 365 * 24 * 60 * 60
+
+# Codifiche precompresse, in ordine di preferenza
+PRECOMPRESSED = (('br', '.br'), ('gzip', '.gz'))
+
+# Nomi generati da build_assets.hashed_name (es. app.3f2a1b9c0d.css)
+HASHED_NAME_RE = re.compile(r'\.[0-9a-f]{10}\.[A-Za-z0-9]+$')
+
+_manifest = None
+
+def load_manifest():
+    """Legge il manifest dei bundle (nome logico -> nome con hash)"""
+    global _manifest
+    if _manifest is None or app.debug:
+        try:
+            with open(MANIFEST_PATH, encoding='utf-8') as f:
+                _manifest = json.load(f)
+        except (OSError, ValueError):
+            _manifest = {}
+    return _manifest
+
+def asset_urls(name):
+    """Restituisce gli URL da includere per un bundle.
+
+    Se il bundle è stato generato restituisce il solo file con hash; altrimenti
+    i singoli sorgenti, usando il CDN per le librerie non ancora copiate in locale.
+    """
+    manifest = load_manifest()
+    if name in manifest:
+        return [url_for('serve_asset', filename=manifest[name])]
+
+    urls = []
+    for source in BUNDLES[name]:
+        if source in VENDOR and not os.path.isfile(os.path.join(STATIC_DIR, source)):
+            urls.append(VENDOR[source])
+        else:
+            urls.append(url_for('static', filename=source))
+    return urls
+
+@app.context_processor
+def inject_asset_urls():
+    return {'asset_urls': asset_urls}
+
+@app.route('/assets/<path:filename>')
+def serve_asset(filename):
+    """Serve i bundle con hash, precompressi se il browser li accetta"""
+    # Solo i file con hash possono essere dichiarati immutabili (il manifest no)
+    if not HASHED_NAME_RE.search(filename) or not os.path.isfile(os.path.join(DIST_DIR, filename)):
+        abort(404)
+
+    mimetype = mimetypes.guess_type(filename)[0]
+    for encoding, suffix in PRECOMPRESSED:
+        if request.accept_encodings[encoding] and os.path.isfile(os.path.join(DIST_DIR, filename + suffix)):
+            response = send_from_directory(DIST_DIR, filename + suffix,
+                                           mimetype=mimetype, max_age=ASSET_MAX_AGE)
+            response.headers['Content-Encoding'] = encoding
+            break
+    else:
+        response = send_from_directory(DIST_DIR, filename, mimetype=mimetype, max_age=ASSET_MAX_AGE)
+
+    response.cache_control.immutable = True
+    response.vary.add('Accept-Encoding')
+    return response
+
+class AssetSessionInterface(type(app.session_interface)):
+    """Non tocca la sessione sugli asset, così la risposta non riceve Vary: Cookie
+    e può essere riusata anche dalle cache condivise"""
+
+    def save_session(self, app, session, response):
+        if request.endpoint == 'serve_asset':
+            return
+        return super().save_session(app, session, response)
+
+app.session_interface = AssetSessionInterface()
@@ -0,0 +1,197 @@
+"""Build degli asset statici.
+
+Copia in locale le librerie esterne (Bootstrap, Bootstrap Icons), unisce e
+minifica CSS e JavaScript, aggiunge l'hash del contenuto ai nomi dei file e
+genera le versioni precompresse gzip/brotli in static/dist.
+
+Uso: python build_assets.py [--refresh-vendor]
+"""
+import os
+import re
+import json
+import gzip
+import shutil
+import hashlib
+import argparse
+import posixpath
+import urllib.request
+import brotli
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = os.path.join(BASE_DIR, 'static')
+DIST_DIR = os.path.join(STATIC_DIR, 'dist')
+MANIFEST_PATH = os.path.join(DIST_DIR, 'manifest.json')
+
+# Formati già compressi che non ha senso ricomprimere
+COMPRESSIBLE = ('.css', '.js', '.svg', '.json')
+
+# Librerie esterne copiate in static/vendor (percorso locale -> CDN originale)
+VENDOR = {
+    'vendor/bootstrap-agent-dark-theme.min.css': 'https://cdn.replit.com/agent/bootstrap-agent-dark-theme.min.css',
+    'vendor/bootstrap-icons/bootstrap-icons.css': 'https://cdn.jsdelivr.net/npm/bootstrap-icons@1.11.1/font/bootstrap-icons.css',
+    'vendor/bootstrap-icons/fonts/bootstrap-icons.woff2': 'https://cdn.jsdelivr.net/npm/bootstrap-icons@1.11.1/font/fonts/bootstrap-icons.woff2',
+    'vendor/bootstrap-icons/fonts/bootstrap-icons.woff': 'https://cdn.jsdelivr.net/npm/bootstrap-icons@1.11.1/font/fonts/bootstrap-icons.woff',
+    'vendor/bootstrap.bundle.min.js': 'https://cdn.jsdelivr.net/npm/bootstrap@5.3.2/dist/js/bootstrap.bundle.min.js',
+}
+
+# Bundle generati: nome logico -> file sorgenti (relativi a static/) nell'ordine di concatenazione
+BUNDLES = {
+    'app.css': [
+        'vendor/bootstrap-agent-dark-theme.min.css',
+        'vendor/bootstrap-icons/bootstrap-icons.css',
+        'css/custom.css',
+    ],
+    'app.js': [
+        'vendor/bootstrap.bundle.min.js',
+        'js/main.js',
+    ],
+    'bootstrap.js': [
+        'vendor/bootstrap.bundle.min.js',
+    ],
+}
+
+CSS_URL_RE = re.compile(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)')
+
+# Stringhe tra apici e url() senza apici, da non toccare durante la minificazione,
+# oppure commenti da eliminare
+CSS_TOKEN_RE = re.compile(
+    r'("(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\'|url\(\s*[^\'"\s)][^)]*\))'
+    r'|/\*.*?\*/', re.S)
+CSS_PLACEHOLDER_RE = re.compile('\x00(\\d+)\x00')
+
+def fetch_vendor(vendor, refresh=False):
+    """Scarica in static/vendor le librerie mancanti"""
+    for path, url in vendor.items():
+        target = os.path.join(STATIC_DIR, path)
+        if os.path.isfile(target) and not refresh:
+            continue
+        print(f'Scarico {url}')
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with urllib.request.urlopen(url, timeout=30) as response, open(target, 'wb') as f:
+            shutil.copyfileobj(response, f)
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()[:10]
+
+def hashed_name(name, data):
+    root, ext = posixpath.splitext(name)
+    return f'{root}.{content_hash(data)}{ext}'
+
+def minify_css(text):
+    # Stringhe e url() vengono sostituiti da segnaposto e rimessi alla fine,
+    # così spazi, virgole e /* al loro interno restano invariati
+    protected = []
+
+    def mask(match):
+        if match.group(1) is None:
+            return ''
+        protected.append(match.group(1))
+        return f'\x00{len(protected) - 1}\x00'
+
+    text = CSS_TOKEN_RE.sub(mask, text)
+    text = re.sub(r'\s+', ' ', text)
+    text = re.sub(r'\s*([{};,>])\s*', r'\1', text)
+    # I due punti si compattano solo nelle dichiarazioni (seguite da ; o }),
+    # non nei selettori dove ".a :hover" e ".a:hover" sono diversi
+    text = re.sub(r'\s*:\s*(?=[^{}]*[;}])', ':', text)
+    text = text.replace(';}', '}')
+    return CSS_PLACEHOLDER_RE.sub(lambda m: protected[int(m.group(1))], text).strip()
+
+def minify_js(text):
+    # Minificazione conservativa: toglie solo indentazione, righe vuote e
+    # commenti su riga intera, senza toccare stringhe o espressioni regolari
+    lines = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith('//'):
+            continue
+        lines.append(line)
+    return '\n'.join(lines)
+
+def write_output(name, data, written):
+    """Scrive un file in dist con le sue versioni precompresse"""
+    target = os.path.join(DIST_DIR, name)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    with open(target, 'wb') as f:
+        f.write(data)
+    written.add(name)
+
+    if not name.endswith(COMPRESSIBLE):
+        return
+    with open(target + '.gz', 'wb') as f:
+        with gzip.GzipFile(fileobj=f, mode='wb', compresslevel=9, mtime=0) as gz:
+            gz.write(data)
+    written.add(name + '.gz')
+    with open(target + '.br', 'wb') as f:
+        f.write(brotli.compress(data, quality=11))
+    written.add(name + '.br')
+
+def rewrite_css_urls(css, source, written):
+    """Copia in dist i file referenziati dal CSS (es. font) e ne aggiorna gli URL"""
+    source_dir = posixpath.dirname(source)
+
+    def replace(match):
+        url = match.group(2).strip()
+        if url.startswith(('data:', 'http:', 'https:', '//', '#', '/')):
+            return match.group(0)
+        path = url.split('?', 1)[0].split('#', 1)[0]
+        local = posixpath.normpath(posixpath.join(source_dir, path))
+        with open(os.path.join(STATIC_DIR, local), 'rb') as f:
+            data = f.read()
+        name = hashed_name(posixpath.join('files', posixpath.basename(local)), data)
+        if name not in written:
+            write_output(name, data, written)
+        # I bundle stanno nella radice di dist, quindi l'URL relativo è il nome stesso
+        return f'url("{name}")'
+
+    return CSS_URL_RE.sub(replace, css)
+
+def build_bundle(name, sources, written):
+    parts = []
+    for source in sources:
+        with open(os.path.join(STATIC_DIR, source), encoding='utf-8') as f:
+            text = f.read()
+        if name.endswith('.css'):
+            text = minify_css(rewrite_css_urls(text, source, written))
+        elif not source.endswith('.min.js'):
+            text = minify_js(text)
+        parts.append(text)
+
+    separator = '\n' if name.endswith('.css') else ';\n'
+    data = separator.join(parts).encode('utf-8')
+    output = hashed_name(name, data)
+    write_output(output, data, written)
+    return output
+
+def remove_stale(written):
+    """Elimina da dist i file di build precedenti"""
+    for root, _, files in os.walk(DIST_DIR):
+        for filename in files:
+            path = os.path.join(root, filename)
+            name = os.path.relpath(path, DIST_DIR).replace(os.sep, '/')
+            if name != 'manifest.json' and name not in written:
+                os.remove(path)
+
+def build(refresh_vendor=False):
+    fetch_vendor(VENDOR, refresh=refresh_vendor)
+
+    written = set()
+    manifest = {}
+    for name, sources in BUNDLES.items():
+        manifest[name] = build_bundle(name, sources, written)
+        print(f'{name} -> {manifest[name]}')
+
+    remove_stale(written)
+    with open(MANIFEST_PATH, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build degli asset statici del frantoio')
+    parser.add_argument('--refresh-vendor', action='store_true',
+                        help='riscarica le librerie esterne anche se già presenti')
+    args = parser.parse_args(argv)
+    build(refresh_vendor=args.refresh_vendor)
+
+if __name__ == '__main__':
+    main()
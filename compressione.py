@@ -0,0 +1,43 @@
+import gzip
+import brotli
+from flask import request
+from app import app
+
+# Tipi di risposta generati dall'applicazione che conviene comprimere
+MIMETYPE_COMPRIMIBILI = {'text/html', 'application/json'}
+
+# Sotto questa dimensione la compressione non fa risparmiare nulla
+DIMENSIONE_MINIMA = 500
+
+def _comprimi(dati, encoding):
+    if encoding == 'br':
+        return brotli.compress(dati, quality=5)
+    return gzip.compress(dati, compresslevel=6)
+
+def _scegli_encoding():
+    """Codifica preferita tra quelle accettate dal browser"""
+    if request.accept_encodings['br']:
+        return 'br'
+    if request.accept_encodings['gzip']:
+        return 'gzip'
+    return None
+
+@app.after_request
+def comprimi_risposta(response):
+    """Comprime le pagine HTML e le risposte JSON"""
+    if (response.mimetype not in MIMETYPE_COMPRIMIBILI
+            or not 200 <= response.status_code < 300
+            or response.direct_passthrough
+            or response.is_streamed
+            or 'Content-Encoding' in response.headers):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = _scegli_encoding()
+    dati = response.get_data()
+    if encoding is None or len(dati) < DIMENSIONE_MINIMA:
+        return response
+
+    response.set_data(_comprimi(dati, encoding))
+    response.headers['Content-Encoding'] = encoding
+    return response
@@ -0,0 +1,344 @@
+import re
+import unicodedata
+from itertools import groupby
+import click
+from sqlalchemy import inspect, text, select, or_, and_, case, func
+from sqlalchemy.exc import OperationalError, ProgrammingError
+from app import app, db
+
+# Sostituzioni fonetiche applicate in ordine (grafie diverse con lo stesso suono)
+SOSTITUZIONI_FONETICHE = (
+    ('ph', 'f'),
+    ('ch', 'k'),
+    ('gh', 'g'),
+    ('gn', 'n'),
+    ('gli', 'li'),
+    ('sc', 's'),
+    ('q', 'k'),
+    ('c', 'k'),
+    ('x', 'ks'),
+    ('y', 'i'),
+    ('j', 'i'),
+    ('w', 'v'),
+    ('z', 's'),
+    ('h', ''),
+)
+
+# Colonne dell'indice duplicati da aggiungere ai database creati prima della sua introduzione
+COLONNE_INDICE = (
+    ('chiave_nome', 'VARCHAR(200)'),
+    ('chiave_fonetica', 'VARCHAR(200)'),
+    ('telefono_normalizzato', 'VARCHAR(20)'),
+)
+
+# Campi anagrafici che si possono completare con i dati di un duplicato
+CAMPI_COMPLETABILI = ('telefono', 'indirizzo', 'email', 'note')
+
+def _parole(*testi):
+    """Scompone i testi in parole minuscole senza accenti né punteggiatura"""
+    parole = []
+    for testo in testi:
+        testo = unicodedata.normalize('NFKD', testo or '')
+        testo = ''.join(c for c in testo if not unicodedata.combining(c)).lower()
+        testo = testo.replace("'", '').replace('’', '')
+        parole.extend(re.findall(r'[a-z0-9]+', testo))
+    return parole
+
+def codice_fonetico(parola):
+    """Codice fonetico semplificato per nomi italiani (es. Cristina/Kristina, Giuseppe/Giusepe)"""
+    for grafia, suono in SOSTITUZIONI_FONETICHE:
+        parola = parola.replace(grafia, suono)
+    # Le doppie non contano
+    return re.sub(r'(.)\1+', r'\1', parola)
+
+def chiave_nome(nome, cognome):
+    """Chiave normalizzata indipendente dall'ordine (es. 'Rossi Mario' = 'Mario Rossi')"""
+    return ' '.join(sorted(_parole(nome, cognome)))
+
+def chiave_fonetica(nome, cognome):
+    return ' '.join(sorted(codice_fonetico(p) for p in _parole(nome, cognome)))
+
+def normalizza_telefono(telefono):
+    """Solo cifre, senza prefisso internazionale italiano (+39 / 0039)"""
+    cifre = re.sub(r'\D', '', telefono or '')
+    if cifre.startswith('0039'):
+        cifre = cifre[4:]
+    elif cifre.startswith('39') and len(cifre) > 10:
+        cifre = cifre[2:]
+    return cifre or None
+
+def trova_duplicati(nome, cognome, telefono='', escludi_id=None, limite=5):
+    """Clienti probabilmente uguali a quello indicato.
+
+    La ricerca usa solo uguaglianze sulle colonne indicizzate, quindi non
+    scorre l'intera tabella. I risultati con nome e telefono coincidenti
+    vengono prima.
+    """
+    from models import Cliente
+
+    chiave = chiave_nome(nome, cognome)
+    if not chiave:
+        return []
+    telefono = normalizza_telefono(telefono)
+
+    condizioni = [Cliente.chiave_nome == chiave,
+                  Cliente.chiave_fonetica == chiave_fonetica(nome, cognome)]
+    if telefono:
+        condizioni.append(Cliente.telefono_normalizzato == telefono)
+
+    # Ordinamento fatto dal database prima del LIMIT, così il cliente con
+    # stesso nome e stesso telefono non resta escluso dai risultati
+    priorita = [(Cliente.chiave_nome == chiave, 1)]
+    if telefono:
+        priorita.insert(0, (and_(Cliente.chiave_nome == chiave,
+                                 Cliente.telefono_normalizzato == telefono), 0))
+        priorita.append((Cliente.telefono_normalizzato == telefono, 2))
+
+    query = Cliente.query.filter(or_(*condizioni))
+    if escludi_id:
+        query = query.filter(Cliente.id != escludi_id)
+    return query.order_by(case(*priorita, else_=3), Cliente.id).limit(limite).all()
+
+def cliente_esistente(nome, cognome, telefono):
+    """Cliente certamente già registrato: stesso nome (in qualsiasi ordine) e stesso telefono"""
+    from models import Cliente
+
+    telefono = normalizza_telefono(telefono)
+    if not telefono:
+        return None
+    return Cliente.query.filter_by(chiave_nome=chiave_nome(nome, cognome),
+                                   telefono_normalizzato=telefono).order_by(Cliente.id).first()
+
+def completa_dati(cliente, dati):
+    """Riempie i campi vuoti del cliente con i valori presenti in dati"""
+    for campo in CAMPI_COMPLETABILI:
+        if not getattr(cliente, campo) and dati.get(campo):
+            setattr(cliente, campo, dati[campo])
+
+def aggiorna_schema_clienti():
+    """Aggiunge colonne e indici dei duplicati ai database creati prima della loro introduzione.
+
+    Può girare in più worker contemporaneamente: se un altro processo ha già
+    aggiunto la colonna o l'indice l'errore viene ignorato.
+    """
+    from models import Cliente
+
+    def colonne():
+        return {c['name'] for c in inspect(db.engine).get_columns('clienti')}
+
+    def indici():
+        return {i['name'] for i in inspect(db.engine).get_indexes('clienti')}
+
+    se_manca = 'IF NOT EXISTS ' if db.engine.dialect.name == 'postgresql' else ''
+    presenti = colonne()
+    for nome, tipo in COLONNE_INDICE:
+        if nome in presenti:
+            continue
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(text(f'ALTER TABLE clienti ADD COLUMN {se_manca}{nome} {tipo}'))
+        except (OperationalError, ProgrammingError):
+            if nome not in colonne():
+                raise
+
+    presenti = indici()
+    for index in Cliente.__table__.indexes:
+        if index.name in presenti:
+            continue
+        try:
+            index.create(db.engine, checkfirst=True)
+        except (OperationalError, ProgrammingError):
+            if index.name not in indici():
+                raise
+
+def popola_indice_clienti(blocco=500):
+    """Calcola le chiavi dei clienti salvati prima dell'introduzione dell'indice"""
+    from models import Cliente
+
+    aggiornati = 0
+    while True:
+        clienti = Cliente.query.filter(Cliente.chiave_nome.is_(None)).order_by(Cliente.id).limit(blocco).all()
+        if not clienti:
+            return aggiornati
+        for cliente in clienti:
+            cliente.aggiorna_chiavi()
+        db.session.commit()
+        aggiornati += len(clienti)
+
+def _stessa_persona(a, b):
+    """Stesso nome, oppure stesso telefono e nome simile"""
+    if a.chiave_nome == b.chiave_nome:
+        return True
+    return (a.telefono_normalizzato is not None
+            and a.telefono_normalizzato == b.telefono_normalizzato
+            and a.chiave_fonetica == b.chiave_fonetica)
+
+def _valore_confrontabile(campo, valore):
+    if campo == 'telefono':
+        return normalizza_telefono(valore)
+    return ' '.join((valore or '').split()).lower() or None
+
+def _in_conflitto(clienti):
+    """Vero se i clienti hanno valori diversi in un campo che l'unione andrebbe a perdere"""
+    for campo in CAMPI_COMPLETABILI:
+        valori = {_valore_confrontabile(campo, getattr(c, campo)) for c in clienti}
+        valori.discard(None)
+        if len(valori) > 1:
+            return True
+    return False
+
+def _blocchi(colonna):
+    """Clienti che condividono il valore di colonna con almeno un altro, raggruppati per valore.
+
+    Una sola query per chiave, letta a blocchi: si caricano solo le colonne
+    che servono al confronto, senza creare oggetti Cliente nella sessione.
+    """
+    from models import Cliente
+
+    ripetuti = select(colonna).where(colonna.isnot(None)).group_by(colonna) \
+        .having(func.count(Cliente.id) > 1)
+    righe = db.session.query(Cliente.id, Cliente.chiave_nome, Cliente.chiave_fonetica,
+                             Cliente.telefono_normalizzato,
+                             *(getattr(Cliente, campo) for campo in CAMPI_COMPLETABILI)) \
+        .filter(colonna.in_(ripetuti)).order_by(colonna, Cliente.id) \
+        .yield_per(app.config['DB_YIELD_PER'])
+    for _, membri in groupby(righe, key=lambda riga: getattr(riga, colonna.key)):
+        yield list(membri)
+
+def gruppi_duplicati():
+    """Gruppi di clienti da unire e gruppi da verificare a mano, ciascuno ordinato per id.
+
+    I confronti avvengono solo all'interno dei blocchi con la stessa chiave
+    (nome normalizzato o telefono) sulle colonne indicizzate.
+    Regola prudente: due clienti con telefoni diversi non finiscono mai nello
+    stesso gruppo, e un cliente senza telefono viene unito solo se corrisponde
+    a un unico telefono. Un gruppo va verificato a mano anche quando i clienti
+    hanno indirizzo, email, telefono o note diversi, che l'unione perderebbe.
+    """
+    from models import Cliente
+
+    genitore = {}
+    righe = {}
+
+    def radice(x):
+        while genitore.setdefault(x, x) != x:
+            genitore[x] = genitore[genitore[x]]
+            x = genitore[x]
+        return x
+
+    def unisci(a, b):
+        ra, rb = radice(a), radice(b)
+        if ra != rb:
+            genitore[max(ra, rb)] = min(ra, rb)
+
+    # Coppie (cliente senza telefono, cliente con telefono) decise solo alla fine
+    senza_telefono = []
+    for colonna in (Cliente.chiave_nome, Cliente.telefono_normalizzato):
+        for membri in _blocchi(colonna):
+            for i, a in enumerate(membri):
+                for b in membri[i + 1:]:
+                    if not _stessa_persona(a, b):
+                        continue
+                    righe[a.id], righe[b.id] = a, b
+                    ta, tb = a.telefono_normalizzato, b.telefono_normalizzato
+                    if ta == tb:
+                        unisci(a.id, b.id)
+                    elif ta is None:
+                        senza_telefono.append((a.id, b.id))
+                    elif tb is None:
+                        senza_telefono.append((b.id, a.id))
+
+    # Ogni gruppo con telefono ha un solo numero: un cliente senza telefono
+    # si aggiunge solo se tutte le sue corrispondenze portano allo stesso gruppo
+    candidati = {}
+    for senza, con in senza_telefono:
+        candidati.setdefault(radice(senza), set()).add(radice(con))
+    da_verificare = {}
+    for senza, gruppi_con in candidati.items():
+        if len(gruppi_con) == 1:
+            unisci(senza, gruppi_con.pop())
+        else:
+            da_verificare[senza] = gruppi_con
+
+    gruppi = {}
+    for cliente_id in list(genitore):
+        gruppi.setdefault(radice(cliente_id), []).append(cliente_id)
+
+    ambigui = []
+    for senza, gruppi_con in da_verificare.items():
+        ids = set(gruppi.get(senza, [senza]))
+        for r in gruppi_con:
+            ids.update(gruppi.get(radice(r), [r]))
+        ambigui.append(sorted(ids))
+        # Non si unisce nulla che sia coinvolto in un caso dubbio
+        gruppi.pop(senza, None)
+
+    da_unire = []
+    for ids in gruppi.values():
+        if len(ids) < 2:
+            continue
+        if _in_conflitto([righe[i] for i in ids]):
+            ambigui.append(sorted(ids))
+        else:
+            da_unire.append(sorted(ids))
+    return sorted(da_unire), sorted(ambigui)
+
+def unisci_clienti(ids):
+    """Unisce i clienti nel primo della lista, spostandogli tutte le moliture"""
+    from models import Cliente, Molitura
+
+    superstite = db.session.get(Cliente, ids[0])
+    doppi = Cliente.query.filter(Cliente.id.in_(ids[1:])).order_by(Cliente.id).all()
+
+    # Completa i dati mancanti del cliente che resta
+    for doppio in doppi:
+        completa_dati(superstite, {campo: getattr(doppio, campo) for campo in CAMPI_COMPLETABILI})
+    db.session.flush()
+
+    spostate = Molitura.query.filter(Molitura.cliente_id.in_(ids[1:])) \
+        .update({Molitura.cliente_id: superstite.id}, synchronize_session=False)
+    Cliente.query.filter(Cliente.id.in_(ids[1:])).delete(synchronize_session=False)
+    db.session.expire_all()
+    return superstite, spostate
+
+@app.cli.command('indicizza-clienti')
+def indicizza_clienti_command():
+    """Calcola le chiavi dei duplicati per i clienti registrati prima della loro introduzione."""
+    click.echo(f'Clienti indicizzati: {popola_indice_clienti()}.')
+
+def _descrivi(ids):
+    from models import Cliente
+
+    return ', '.join(f'#{c.id} {c.nome_completo} ({c.telefono or "-"})'
+                     for c in Cliente.query.filter(Cliente.id.in_(ids)).order_by(Cliente.id))
+
+@app.cli.command('deduplica-clienti')
+@click.option('--applica', is_flag=True, help='Esegue le unioni (di default mostra solo i gruppi trovati)')
+@click.option('--blocco', default=200, show_default=True, help='Gruppi uniti per ogni commit')
+def deduplica_clienti_command(applica, blocco):
+    """Trova i clienti duplicati e li unisce spostando le moliture sul cliente più vecchio."""
+    popola_indice_clienti()
+    gruppi, ambigui = gruppi_duplicati()
+
+    for ids in ambigui:
+        click.echo(f'Da verificare a mano: {_descrivi(ids)}')
+    if not gruppi:
+        click.echo('Nessun cliente duplicato da unire.')
+        return
+
+    totale_moliture = 0
+    for n, ids in enumerate(gruppi, 1):
+        if not applica:
+            click.echo(_descrivi(ids))
+            continue
+        _, spostate = unisci_clienti(ids)
+        totale_moliture += spostate
+        if n % blocco == 0:
+            db.session.commit()
+
+    if applica:
+        db.session.commit()
+        click.echo(f'Uniti {sum(len(ids) - 1 for ids in gruppi)} clienti duplicati in {len(gruppi)} '
+                   f'clienti, {totale_moliture} moliture spostate.')
+    else:
+        click.echo(f'{len(gruppi)} gruppi di duplicati. Usa --applica per unirli.')
@@ -0,0 +1,35 @@
+import threading
+from collections import OrderedDict
+from markupsafe import Markup
+from app import app
+
+# Righe tenute in memoria da ogni worker prima di scartare le meno usate
+app.config.setdefault('FRAGMENT_CACHE_SIZE', 5000)
+
+_righe = OrderedDict()
+_lock = threading.Lock()
+
+def riga_in_cache(template, oggetto, versione):
+    """Restituisce la riga di tabella di un oggetto, rigenerandola solo se è cambiata.
+
+    La chiave è formata da template e id, la versione dai dati mostrati nella
+    riga: se un dato cambia la versione non corrisponde più e la riga viene
+    rigenerata, senza bisogno di invalidare la cache a ogni modifica.
+    """
+    chiave = (template, oggetto.id)
+    with _lock:
+        trovata = _righe.get(chiave)
+        if trovata is not None and trovata[0] == versione:
+            _righe.move_to_end(chiave)
+            return trovata[1]
+
+    html = Markup(app.jinja_env.get_template(template).render(oggetto=oggetto))
+
+    with _lock:
+        _righe[chiave] = (versione, html)
+        _righe.move_to_end(chiave)
+        while len(_righe) > app.config['FRAGMENT_CACHE_SIZE']:
+            _righe.popitem(last=False)
+    return html
+
+app.jinja_env.globals['riga_in_cache'] = riga_in_cache
@@ -1,6 +1,6 @@
 from datetime import datetime
 from app import db
-from sqlalchemy import String, Integer, DateTime, Text, ForeignKey, Boolean
+from sqlalchemy import String, Integer, DateTime, Text, ForeignKey, Boolean, event
 from sqlalchemy.orm import relationship
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import UserMixin
@@ -17,6 +17,11 @@ class Cliente(db.Model):
     note = db.Column(Text)
     data_creazione = db.Column(DateTime, default=datetime.utcnow)
     
+    # Chiavi per la ricerca dei duplicati (calcolate automaticamente al salvataggio)
+    chiave_nome = db.Column(String(200), index=True)
+    chiave_fonetica = db.Column(String(200), index=True)
+    telefono_normalizzato = db.Column(String(20), index=True)
+    
     # Relationship with moliture
     moliture = relationship("Molitura", back_populates="cliente", cascade="all, delete-orphan")
     
@@ -24,6 +29,19 @@ class Cliente(db.Model):
     def nome_completo(self):
         return f"{self.nome} {self.cognome}"
     
+    def aggiorna_chiavi(self):
+        """Ricalcola le chiavi usate per trovare i duplicati"""
+        from deduplica import chiave_nome, chiave_fonetica, normalizza_telefono
+        self.chiave_nome = chiave_nome(self.nome, self.cognome)
+        self.chiave_fonetica = chiave_fonetica(self.nome, self.cognome)
+        self.telefono_normalizzato = normalizza_telefono(self.telefono)
+    
+    @property
+    def versione_riga(self):
+        """Dati mostrati nella riga della lista clienti (chiave della cache delle righe)"""
+        return (self.nome, self.cognome, self.telefono, self.email, self.note,
+                self.data_creazione, len(self.moliture))
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -36,6 +54,11 @@ class Cliente(db.Model):
             'note': self.note
         }
 
+@event.listens_for(Cliente, 'before_insert')
+@event.listens_for(Cliente, 'before_update')
+def aggiorna_chiavi_cliente(mapper, connection, target):
+    target.aggiorna_chiavi()
+
 class Molitura(db.Model):
     __tablename__ = 'moliture'
     
@@ -55,6 +78,12 @@ class Molitura(db.Model):
     def quantita_totale(self):
         return sum(cassone.quantita for cassone in self.cassoni)
     
+    @property
+    def versione_riga(self):
+        """Dati mostrati nella riga della lista moliture (chiave della cache delle righe)"""
+        return (self.cliente_id, self.cliente.nome_completo if self.cliente else '', self.data_ora,
+                self.sezione, self.stato, tuple((c.numero_cassone, c.quantita) for c in self.cassoni))
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -44,30 +44,21 @@ def generate_moliture_report(moliture):
     story.append(data_gen)
     story.append(Spacer(1, 20))
     
-    # Riepilogo
+    # Riepilogo: le moliture vengono lette una sola volta (possono arrivare
+    # a blocchi dal database), quindi la tabella si inserisce qui alla fine
     story.append(Paragraph("RIEPILOGO", heading_style))
-    
-    riepilogo_data = [
-        ['Numero Moliture:', str(len(moliture))],
-        ['Totale Cassoni:', str(sum(len(m.cassoni) for m in moliture))],
-        ['Quantità Totale (kg):', str(sum(m.quantita_totale for m in moliture))],
-    ]
-    
-    riepilogo_table = Table(riepilogo_data, colWidths=[80*mm, 40*mm])
-    riepilogo_table.setStyle(TableStyle([
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
-    ]))
-    
-    story.append(riepilogo_table)
+    posizione_riepilogo = len(story)
+    numero_moliture = totale_cassoni = quantita_totale = 0
     story.append(Spacer(1, 20))
     
     # Dettaglio moliture
     story.append(Paragraph("DETTAGLIO MOLITURE", heading_style))
     
     for molitura in moliture:
+        numero_moliture += 1
+        totale_cassoni += len(molitura.cassoni)
+        quantita_totale += molitura.quantita_totale
+        
         # Intestazione molitura
         molitura_title = f"Molitura #{molitura.id} - {molitura.cliente.nome_completo}"
         story.append(Paragraph(molitura_title, styles['Heading3']))
@@ -123,6 +114,21 @@ def generate_moliture_report(moliture):
         
         story.append(Spacer(1, 20))
     
+    riepilogo_data = [
+        ['Numero Moliture:', str(numero_moliture)],
+        ['Totale Cassoni:', str(totale_cassoni)],
+        ['Quantità Totale (kg):', str(quantita_totale)],
+    ]
+    
+    riepilogo_table = Table(riepilogo_data, colWidths=[80*mm, 40*mm])
+    riepilogo_table.setStyle(TableStyle([
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, -1), 10),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
+    ]))
+    story.insert(posizione_riepilogo, riepilogo_table)
+    
     # Costruisci PDF
     doc.build(story)
     buffer.seek(0)
@@ -1,8 +1,10 @@
 from datetime import datetime
 from flask import render_template, request, redirect, url_for, flash, jsonify, make_response, session
 from flask_login import login_user, logout_user, login_required, current_user
+from sqlalchemy.orm import selectinload
 from app import app, db
 from pdf_generator import generate_moliture_report
+from deduplica import trova_duplicati, cliente_esistente, completa_dati
 import json
 
 @app.route('/login', methods=['GET', 'POST'])
@@ -79,19 +81,27 @@ def nuova_molitura():
         try:
             # Gestione cliente
             cliente_id = request.form.get('cliente_id')
+            cliente = None
+            avviso_cliente = None
             if not cliente_id:
-                # Crea nuovo cliente
-                cliente = Cliente(
-                    nome=request.form['nome'],
-                    cognome=request.form['cognome'],
-                    telefono=request.form.get('telefono', ''),
-                    indirizzo=request.form.get('indirizzo', ''),
-                    email=request.form.get('email', ''),
-                    note=request.form.get('note_cliente', '')
-                )
-                db.session.add(cliente)
-                db.session.flush()  # Per ottenere l'ID
-                cliente_id = cliente.id
+                dati_cliente = {
+                    'nome': request.form['nome'],
+                    'cognome': request.form['cognome'],
+                    'telefono': request.form.get('telefono', ''),
+                    'indirizzo': request.form.get('indirizzo', ''),
+                    'email': request.form.get('email', ''),
+                    'note': request.form.get('note_cliente', '')
+                }
+                # Riusa il cliente se è già registrato con lo stesso nome e telefono,
+                # completandone i dati mancanti con quelli inseriti
+                cliente = cliente_esistente(dati_cliente['nome'], dati_cliente['cognome'],
+                                            dati_cliente['telefono'])
+                if cliente:
+                    completa_dati(cliente, dati_cliente)
+                    avviso_cliente = f'Cliente già presente: la molitura è stata associata a {cliente.nome_completo}.'
+                else:
+                    # Crea nuovo cliente
+                    cliente = Cliente(**dati_cliente)
             
             # Data e ora
             if request.form.get('usa_ora_corrente'):
@@ -107,30 +117,33 @@ def nuova_molitura():
                 flash('Non hai i permessi per creare moliture in questa sezione.', 'error')
                 return redirect(url_for('nuova_molitura'))
             
-            # Crea molitura
+            # Crea molitura: cliente, molitura e cassoni vengono inseriti tutti al
+            # commit, ricavando gli ID con RETURNING invece di un flush per ognuno
             molitura = Molitura(
-                cliente_id=cliente_id,
                 sezione=sezione,
                 data_ora=data_ora,
                 stato=request.form['stato'],
                 note=request.form.get('note_molitura', '')
             )
-            db.session.add(molitura)
-            db.session.flush()  # Per ottenere l'ID
+            if cliente is not None:
+                molitura.cliente = cliente
+            else:
+                molitura.cliente_id = int(cliente_id)
             
             # Gestione cassoni
             cassoni_data = request.form.getlist('cassoni')
             for cassone_str in cassoni_data:
                 if cassone_str:
                     numero, quantita = cassone_str.split(':')
-                    cassone = Cassone(
-                        molitura_id=molitura.id,
+                    molitura.cassoni.append(Cassone(
                         numero_cassone=int(numero),
                         quantita=int(quantita)
-                    )
-                    db.session.add(cassone)
+                    ))
+            db.session.add(molitura)
             
             db.session.commit()
+            if avviso_cliente:
+                flash(avviso_cliente, 'info')
             flash('Molitura creata con successo!', 'success')
             return redirect(url_for('moliture'))
             
@@ -167,9 +180,14 @@ def moliture():
     if sezione:
         query = query.filter(Molitura.sezione == int(sezione))
     
-    moliture = query.order_by(Molitura.data_ora.desc()).all()
+    totale_moliture = query.count()
+    
+    # Le righe vengono lette a blocchi mentre il template le scorre (cursore lato
+    # server su PostgreSQL); cliente e cassoni caricati per blocco, non riga per riga
+    moliture = query.options(selectinload(Molitura.cliente), selectinload(Molitura.cassoni)) \
+        .order_by(Molitura.data_ora.desc()).yield_per(app.config['DB_YIELD_PER'])
     
-    return render_template('moliture.html', moliture=moliture,
+    return render_template('moliture.html', moliture=moliture, totale_moliture=totale_moliture,
                          filtri={'data_da': data_da, 'data_a': data_a, 'stato': stato, 'sezione': sezione})
 
 @app.route('/modifica_molitura/<int:id>', methods=['GET', 'POST'])
@@ -250,7 +268,8 @@ def clienti():
     """Pagina gestione clienti"""
     from models import Cliente
     
-    clienti_list = Cliente.query.order_by(Cliente.cognome, Cliente.nome).all()
+    clienti_list = Cliente.query.options(selectinload(Cliente.moliture)) \
+        .order_by(Cliente.cognome, Cliente.nome).all()
     clienti_data = [cliente.to_dict() for cliente in clienti_list]
     return render_template('clienti.html', clienti=clienti_list, clienti_data=clienti_data)
 
@@ -261,6 +280,12 @@ def nuovo_cliente():
     from models import Cliente
     
     try:
+        esistente = cliente_esistente(request.form['nome'], request.form['cognome'],
+                                      request.form.get('telefono', ''))
+        if esistente:
+            flash(f'Cliente già presente: {esistente.nome_completo}.', 'warning')
+            return redirect(url_for('clienti'))
+        
         cliente = Cliente(
             nome=request.form['nome'],
             cognome=request.form['cognome'],
@@ -340,6 +365,18 @@ def search_clienti():
     
     return jsonify([cliente.to_dict() for cliente in clienti])
 
+@app.route('/verifica_duplicati_cliente')
+@login_required
+def verifica_duplicati_cliente():
+    """API per segnalare clienti simili durante l'inserimento"""
+    duplicati = trova_duplicati(
+        request.args.get('nome', ''),
+        request.args.get('cognome', ''),
+        request.args.get('telefono', ''),
+        escludi_id=request.args.get('escludi_id', type=int)
+    )
+    return jsonify([cliente.to_dict() for cliente in duplicati])
+
 @app.route('/genera_report_pdf', methods=['POST'])
 @login_required
 def genera_report_pdf():
@@ -352,9 +389,11 @@ def genera_report_pdf():
             flash('Seleziona almeno una molitura per generare il report.', 'error')
             return redirect(url_for('moliture'))
         
-        moliture = Molitura.query.filter(Molitura.id.in_(moliture_ids)).order_by(Molitura.data_ora).all()
+        moliture = Molitura.query.filter(Molitura.id.in_(moliture_ids)) \
+            .options(selectinload(Molitura.cliente), selectinload(Molitura.cassoni)) \
+            .order_by(Molitura.data_ora).yield_per(app.config['DB_YIELD_PER'])
         
-        # Genera PDF
+        # Genera PDF leggendo le moliture a blocchi
         pdf_buffer = generate_moliture_report(moliture)
         
         # Crea response
@@ -380,7 +419,7 @@ def cliente_moliture(id):
     accessible_sections = current_user.get_accessible_sections()
     moliture = Molitura.query.filter_by(cliente_id=id).filter(
         Molitura.sezione.in_(accessible_sections)
-    ).order_by(Molitura.data_ora.desc()).all()
+    ).options(selectinload(Molitura.cassoni)).order_by(Molitura.data_ora.desc()).all()
     
     return render_template('cliente_moliture.html', cliente=cliente, moliture=moliture)
 
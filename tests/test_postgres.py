@@ -0,0 +1,145 @@
+"""Profilo PostgreSQL, provato su un cluster temporaneo avviato con initdb/pg_ctl.
+
+Non serve Docker: se i binari di PostgreSQL non sono nel PATH il modulo viene saltato.
+"""
+import os
+import shutil
+import subprocess
+import pytest
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+
+PORTA = 54329
+
+@pytest.fixture(scope='module')
+def postgres_url(tmp_path_factory):
+    initdb, pg_ctl = shutil.which('initdb'), shutil.which('pg_ctl')
+    if not initdb or not pg_ctl:
+        pytest.skip('initdb/pg_ctl non disponibili')
+    if os.geteuid() == 0:
+        pytest.skip('PostgreSQL non si avvia come root')
+
+    base = tmp_path_factory.mktemp('pg')
+    dati, socket_dir = base / 'dati', base / 'sock'
+    socket_dir.mkdir()
+    subprocess.run([initdb, '-D', str(dati), '-U', 'postgres', '-A', 'trust', '--no-sync'],
+                   check=True, capture_output=True)
+    subprocess.run([pg_ctl, '-D', str(dati), '-l', str(base / 'log'), '-w', 'start',
+                    '-o', f"-p {PORTA} -k {socket_dir} -c listen_addresses=''"],
+                   check=True, capture_output=True)
+    try:
+        yield f'postgresql://postgres@/postgres?host={socket_dir}&port={PORTA}'
+    finally:
+        subprocess.run([pg_ctl, '-D', str(dati), '-m', 'immediate', 'stop'], capture_output=True)
+
+@pytest.fixture(scope='module')
+def app(postgres_url):
+    # Le variabili vengono ripristinate a fine modulo, così il cluster fermato
+    # non resta in DATABASE_URL per gli altri test
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setenv('DATABASE_URL', postgres_url)
+        mp.setenv('DB_POOL_SIZE', '3')
+        mp.setenv('DB_MAX_OVERFLOW', '4')
+        mp.setenv('DB_STATEMENT_TIMEOUT', '1234')
+        mp.setenv('DB_YIELD_PER', '2')
+        from app import app, db
+        yield app
+        with app.app_context():
+            db.engine.dispose()
+
+@pytest.fixture
+def client(app):
+    client = app.test_client()
+    client.post('/login', data={'username': 'admin', 'password': 'admin123'})
+    return client
+
+def _nuova_molitura(client, nome, cassoni):
+    return client.post('/nuova_molitura', data={
+        'nome': nome, 'cognome': 'Prova', 'telefono': '', 'sezione': '1',
+        'stato': 'accettazione', 'usa_ora_corrente': '1',
+        'cassoni': [f'{n}:{q}' for n, q in cassoni],
+    })
+
+def test_url_usa_psycopg2(app):
+    from app import db
+    assert app.config['SQLALCHEMY_DATABASE_URI'].startswith('postgresql+psycopg2://')
+    with app.app_context():
+        assert db.engine.dialect.driver == 'psycopg2'
+
+def test_pool_e_statement_timeout(app):
+    from app import db
+    with app.app_context():
+        pool = db.engine.pool
+        assert pool.size() == 3
+        assert app.config['SQLALCHEMY_ENGINE_OPTIONS']['max_overflow'] == 4
+        # Oltre le 3 connessioni del pool se ne aprono altre 4 in overflow
+        connessioni = [db.engine.connect() for _ in range(7)]
+        try:
+            assert pool.checkedout() == 7
+            assert pool.overflow() == 4
+            assert connessioni[0].execute(text('SHOW statement_timeout')).scalar() == '1234ms'
+        finally:
+            for conn in connessioni:
+                conn.close()
+
+def test_nuova_molitura_un_solo_commit(app, client):
+    from app import db
+    from models import Molitura
+
+    statements, flush, commit = [], [], []
+    with app.app_context():
+        engine = db.engine
+    registra = lambda conn, cursor, statement, *args: statements.append(statement)
+    conta_commit = lambda conn: commit.append(1)
+    conta_flush = lambda session, ctx: flush.append(1)
+    event.listen(engine, 'before_cursor_execute', registra)
+    event.listen(engine, 'commit', conta_commit)
+    event.listen(Session, 'after_flush', conta_flush)
+    try:
+        risposta = _nuova_molitura(client, 'Singolo', [(1, 200), (2, 300), (3, 150)])
+    finally:
+        event.remove(engine, 'before_cursor_execute', registra)
+        event.remove(engine, 'commit', conta_commit)
+        event.remove(Session, 'after_flush', conta_flush)
+
+    assert risposta.status_code == 302
+    assert len(flush) == 1 and len(commit) == 1
+    insert = [s for s in statements if s.startswith('INSERT')]
+    assert [s.split()[2] for s in insert] == ['clienti', 'moliture', 'cassoni']
+    assert all('RETURNING' in s for s in insert)
+
+    with app.app_context():
+        molitura = Molitura.query.order_by(Molitura.id.desc()).first()
+        assert molitura.cliente.nome == 'Singolo'
+        assert sorted((c.numero_cassone, c.quantita) for c in molitura.cassoni) == [(1, 200), (2, 300), (3, 150)]
+
+def test_lista_e_report_con_cursore_lato_server(app, client):
+    from app import db
+    from models import Molitura
+
+    for i in range(5):
+        _nuova_molitura(client, f'Lista{i}', [(1, 100 + i)])
+
+    cursori = []
+    with app.app_context():
+        engine = db.engine
+        ids = [m.id for m in Molitura.query.all()]
+    registra = lambda conn, cursor, statement, *args: cursori.append(cursor.name)
+    event.listen(engine, 'before_cursor_execute', registra)
+    try:
+        lista = client.get('/moliture')
+        report = client.post('/genera_report_pdf', data={'moliture_selezionate': [str(i) for i in ids]})
+    finally:
+        event.remove(engine, 'before_cursor_execute', registra)
+
+    assert lista.status_code == 200
+    pagina = lista.get_data(as_text=True)
+    assert f'Lista Moliture ({len(ids)})' in pagina
+    assert all(f'Lista{i} Prova' in pagina for i in range(5))
+
+    assert report.status_code == 200
+    assert report.headers['Content-Type'] == 'application/pdf'
+    assert report.data.startswith(b'%PDF')
+
+    # psycopg2 usa un cursore con nome per i risultati letti a blocchi
+    assert any(nome is not None for nome in cursori)